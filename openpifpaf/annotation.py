@@ -25,13 +25,7 @@ class Annotation(Base):
         self.score_weights = score_weights
         self.suppress_score_index = suppress_score_index
 
-        self.category_id = 1
-        self.data = np.zeros((len(keypoints), 3), dtype=np.float32)
-        self.joint_scales = np.zeros((len(keypoints),), dtype=np.float32)
-        self.fixed_score = None
-        self.fixed_bbox = None
-        self.decoding_order = []
-        self.frontier_order = []
+        self._init_instance_state()
 
         self.skeleton_m1 = (np.asarray(skeleton) - 1).tolist()
         if score_weights is None:
@@ -43,6 +37,26 @@ class Annotation(Base):
             self.score_weights[-len(self.suppress_score_index):] = 0.0
         self.score_weights /= np.sum(self.score_weights)
 
+    def fresh(self):
+        """A new annotation with the same metadata and no keypoints.
+
+        Skips the preprocessing of the constructor, e.g. when many
+        annotations are created from one template.
+        """
+        ann = copy.copy(self)
+        ann._init_instance_state()  # pylint: disable=protected-access
+        return ann
+
+    def _init_instance_state(self):
+        """Per-instance state, i.e. everything that fresh() does not share."""
+        self.category_id = 1
+        self.data = np.zeros((len(self.keypoints), 3), dtype=np.float32)
+        self.joint_scales = np.zeros((len(self.keypoints),), dtype=np.float32)
+        self.fixed_score = None
+        self.fixed_bbox = None
+        self.decoding_order = []
+        self.frontier_order = []
+
     @classmethod
     def from_cif_meta(cls, cif_meta: headmeta.Cif):
         scale = np.sqrt(
@@ -90,11 +104,6 @@ class Annotation(Base):
         self.data[:, 1] *= scale_y
         if self.joint_scales is not None:
             self.joint_scales *= scale_factor
-        for _, __, c1, c2 in self.decoding_order:
-            c1[0:1] *= scale_x
-            c1[1:2] *= scale_y
-            c2[0:1] *= scale_x
-            c2[1:2] *= scale_y
         return self
 
     def fill_joint_scales(self, scales, hr_scale=1.0):
@@ -213,13 +222,6 @@ class Annotation(Base):
             if ann.fixed_bbox is not None:
                 ann.fixed_bbox[0] = -(ann.fixed_bbox[0] + ann.fixed_bbox[2]) - 1.0 + w
 
-        for _, __, c1, c2 in ann.decoding_order:
-            c1[:2] += meta['offset']
-            c2[:2] += meta['offset']
-
-            c1[:2] /= meta['scale']
-            c2[:2] /= meta['scale']
-
         return ann
 
 
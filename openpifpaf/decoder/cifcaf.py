@@ -1,5 +1,6 @@
 import argparse
 from collections import defaultdict
+import concurrent.futures
 import heapq
 import logging
 import time
@@ -13,7 +14,7 @@ from . import utils
 from .. import headmeta, visualizer
 
 # pylint: disable=import-error
-from ..functional import caf_center_s, grow_connection_blend
+from ..functional import connection_value, p2p_value, BucketedFrontier, Frontier
 
 LOG = logging.getLogger(__name__)
 
@@ -31,7 +32,9 @@ class DenseAdapter:
 
         concatenated_caf_meta = headmeta.Caf.concatenate(
             [caf_meta, dense_caf_meta])
-        self.cifcaf = CifCaf([cif_meta], [concatenated_caf_meta])
+        # the fields are not concatenated, so visualize them separately
+        self.caf_visualizers = [visualizer.Caf(caf_meta), visualizer.Caf(dense_caf_meta)]
+        self.cifcaf = CifCaf([cif_meta], [concatenated_caf_meta], caf_visualizers=[])
 
     @classmethod
     def factory(cls, head_metas):
@@ -46,12 +49,16 @@ class DenseAdapter:
         ]
 
     def __call__(self, fields, initial_annotations=None):
+        for vis, meta in zip(self.caf_visualizers, (self.caf_meta, self.dense_caf_meta)):
+            vis.predicted(fields[meta.head_index])
+
+        # CafScored accepts the concatenated CAF field as a list of its parts
         cifcaf_fields = [
             fields[self.cif_meta.head_index],
-            np.concatenate([
+            [
                 fields[self.caf_meta.head_index],
                 fields[self.dense_caf_meta.head_index],
-            ], axis=0)
+            ],
         ]
         return self.cifcaf(cifcaf_fields)
 
@@ -73,6 +80,17 @@ class CifCaf(Decoder):
     dense_coupling = 0.0
 
     reverse_match = True
+    # skip the reverse match for connections above this fraction of the source score
+    reverse_match_skip_ratio = None
+    reverse_match_skip_max_scale = 8.0
+
+    # number of score buckets for an approximate frontier, None for the exact heap
+    frontier_buckets = None
+    # threads to complete independent annotations, 0 for serial
+    complete_threads = 0
+    # fill ann.decoding_order and ann.frontier_order for visualization,
+    # set by show.configure()
+    record_decoding_order = False
 
     def __init__(self,
                  cif_metas: List[headmeta.Cif],
@@ -88,6 +106,9 @@ class CifCaf(Decoder):
         self.score_weights = cif_metas[0].score_weights
         self.out_skeleton = caf_metas[0].skeleton
         self.confidence_scales = caf_metas[0].decoder_confidence_scales
+        self._conf_scales = np.ones((len(self.skeleton_m1),), dtype=np.float32)
+        if self.confidence_scales is not None:
+            self._conf_scales[:] = self.confidence_scales
 
         self.cif_visualizers = cif_visualizers
         if self.cif_visualizers is None:
@@ -102,15 +123,68 @@ class CifCaf(Decoder):
 
         self.timers = defaultdict(float)
 
-        # init by_target and by_source
-        self.by_target = defaultdict(dict)
+        # (CifHr, Occupancy) pairs of previous images that no call is using
+        self._free_buffers = []
+        self._ann_template = Annotation(self.keypoints,
+                                        self.out_skeleton,
+                                        score_weights=self.score_weights)
+        self._resolve_connection_config()
+
+        # connections as (K, K) lookup tables and neighbors in CSR format:
+        # the neighbors of joint j are neighbors_idx[neighbors_ptr[j]:neighbors_ptr[j + 1]]
+        n_keypoints = len(self.keypoints)
+        self.caf_index = np.full((n_keypoints, n_keypoints), -1, dtype=np.int16)
+        self.forward = np.zeros((n_keypoints, n_keypoints), dtype=np.bool_)
+        neighbors = [[] for _ in range(n_keypoints)]
         for caf_i, (j1, j2) in enumerate(self.skeleton_m1):
-            self.by_target[j2][j1] = (caf_i, True)
-            self.by_target[j1][j2] = (caf_i, False)
-        self.by_source = defaultdict(dict)
+            for start_i, end_i, forward in ((j1, j2, True), (j2, j1, False)):
+                if self.caf_index[start_i, end_i] == -1:
+                    neighbors[start_i].append(end_i)
+                self.caf_index[start_i, end_i] = caf_i
+                self.forward[start_i, end_i] = forward
+        self.neighbors_ptr = np.cumsum(
+            [0] + [len(n) for n in neighbors], dtype=np.int32)
+        self.neighbors_idx = np.array(
+            [end_i for n in neighbors for end_i in n], dtype=np.int32)
+        # the same neighbors as plain lists of (end_i, caf_i) for Python loops
+        self.neighbors = [[(end_i, int(self.caf_index[start_i, end_i])) for end_i in n]
+                          for start_i, n in enumerate(neighbors)]
+
+        # by_target and by_source are only built on first access
+        self._by_target = None
+        self._by_source = None
+
+    def _init_by_target_by_source(self):
+        self._by_target = defaultdict(dict)
+        self._by_source = defaultdict(dict)
         for caf_i, (j1, j2) in enumerate(self.skeleton_m1):
-            self.by_source[j1][j2] = (caf_i, True)
-            self.by_source[j2][j1] = (caf_i, False)
+            self._by_target[j2][j1] = (caf_i, True)
+            self._by_target[j1][j2] = (caf_i, False)
+            self._by_source[j1][j2] = (caf_i, True)
+            self._by_source[j2][j1] = (caf_i, False)
+
+    @property
+    def by_target(self):
+        """Connections as by_target[end_i][start_i] = (caf_i, forward)."""
+        if self._by_target is None:
+            self._init_by_target_by_source()
+        return self._by_target
+
+    @property
+    def by_source(self):
+        """Connections as by_source[start_i][end_i] = (caf_i, forward)."""
+        if self._by_source is None:
+            self._init_by_target_by_source()
+        return self._by_source
+
+    def _resolve_connection_config(self):
+        """Resolve the class configuration for connection_value() once per image."""
+        self._only_max = self.connection_method == 'max'
+        # A connection that keeps almost all of the source score at a small
+        # scale is accepted without running the reverse match.
+        self._reverse_match_skip_ratio = self.reverse_match_skip_ratio
+        if self._reverse_match_skip_ratio is None:
+            self._reverse_match_skip_ratio = np.inf
 
     @classmethod
     def cli(cls, parser: argparse.ArgumentParser):
@@ -155,6 +229,19 @@ class CifCaf(Decoder):
                            default=False, action='store_true')
         group.add_argument('--ablation-independent-kp',
                            default=False, action='store_true')
+        assert cls.reverse_match_skip_ratio is None
+        group.add_argument('--reverse-match-skip', type=float, nargs='?',
+                           default=None, const=0.98,
+                           help=('[experimental] skip the reverse match for connections that '
+                                 'keep more than this fraction of the source score'))
+        group.add_argument('--frontier-buckets', type=int, nargs='?',
+                           default=cls.frontier_buckets, const=256,
+                           help=('[experimental] approximate the priority queue of '
+                                 'connections with score buckets'))
+        group.add_argument('--force-complete-threads', type=int,
+                           default=cls.complete_threads,
+                           help=('[experimental] threads to complete poses in parallel '
+                                 'with --force-complete-pose'))
 
     @classmethod
     def configure(cls, args: argparse.Namespace):
@@ -186,6 +273,9 @@ class CifCaf(Decoder):
         cls.dense_coupling = args.dense_connections
 
         cls.reverse_match = args.reverse_match
+        cls.reverse_match_skip_ratio = args.reverse_match_skip
+        cls.frontier_buckets = args.frontier_buckets
+        cls.complete_threads = args.force_complete_threads
         utils.CifSeeds.ablation_nms = args.ablation_cifseeds_nms
         utils.CifSeeds.ablation_no_rescore = args.ablation_cifseeds_no_rescore
         utils.CafScored.ablation_no_rescore = args.ablation_caf_no_rescore
@@ -208,43 +298,52 @@ class CifCaf(Decoder):
         if not initial_annotations:
             initial_annotations = []
         LOG.debug('initial annotations = %d', len(initial_annotations))
+        self._resolve_connection_config()
 
         for vis, meta in zip(self.cif_visualizers, self.cif_metas):
             vis.predicted(fields[meta.head_index])
         for vis, meta in zip(self.caf_visualizers, self.caf_metas):
             vis.predicted(fields[meta.head_index])
 
-        cifhr = utils.CifHr().fill(fields, self.cif_metas)
+        cifhr, occupied = self._take_buffers()
+        try:
+            return self._decode(fields, initial_annotations, cifhr, occupied, start)
+        finally:
+            # list.append() and list.pop() are atomic, so every buffer is
+            # only used by one call at a time
+            self._free_buffers.append((cifhr, occupied))
+
+    def _take_buffers(self):
+        """CifHr and Occupancy of an earlier image that no other call is using."""
+        try:
+            return self._free_buffers.pop()
+        except IndexError:
+            # the occupancy is resized by reset() in _decode()
+            return utils.CifHr(), utils.Occupancy((0, 0, 0), 2, min_scale=4)
+
+    def _decode(self, fields, initial_annotations, cifhr, occupied, start):
+        cifhr = cifhr.reset().fill(fields, self.cif_metas)
         seeds = utils.CifSeeds(cifhr.accumulated).fill(fields, self.cif_metas)
         caf_scored = utils.CafScored(cifhr.accumulated).fill(fields, self.caf_metas)
 
-        occupied = utils.Occupancy(cifhr.accumulated.shape, 2, min_scale=4)
+        occupied.reset(cifhr.accumulated.shape)
         annotations = []
 
         def mark_occupied(ann):
-            joint_is = np.flatnonzero(ann.data[:, 2])
-            for joint_i in joint_is:
-                width = ann.joint_scales[joint_i]
-                occupied.set(
-                    joint_i,
-                    ann.data[joint_i, 0],
-                    ann.data[joint_i, 1],
-                    width,  # width = 2 * sigma
-                )
+            # width = 2 * sigma
+            occupied.set_keypoints(ann.data, ann.joint_scales)
 
         for ann in initial_annotations:
             self._grow(ann, caf_scored)
             annotations.append(ann)
             mark_occupied(ann)
 
-        for v, f, x, y, s in seeds.get():
+        seeds_f, seeds_vxys = seeds.get_arrays()
+        for f, (v, x, y, s) in zip(seeds_f.tolist(), seeds_vxys.tolist()):
             if occupied.get(f, x, y):
                 continue
 
-            ann = Annotation(self.keypoints,
-                             self.out_skeleton,
-                             score_weights=self.score_weights
-                             ).add(f, (x, y, v))
+            ann = self._ann_template.fresh().add(f, (x, y, v))
             ann.joint_scales[f] = s
             self._grow(ann, caf_scored)
             annotations.append(ann)
@@ -267,86 +366,53 @@ class CifCaf(Decoder):
                  [np.sum(ann.data[:, 2] > 0.1) for ann in annotations])
         return annotations
 
+    def __getstate__(self):
+        # do not pickle the buffers that are reused across images
+        state = super().__getstate__()
+        state.update(_free_buffers=[])
+        return state
+
     def connection_value(self, ann, caf_scored, start_i, end_i, *, reverse_match=True):
-        caf_i, forward = self.by_source[start_i][end_i]
+        caf_i = self.caf_index[start_i, end_i]
+        forward = self.forward[start_i, end_i]
         caf_f, caf_b = caf_scored.directed(caf_i, forward)
-        xyv = ann.data[start_i]
-        xy_scale_s = max(0.0, ann.joint_scales[start_i])
-
-        only_max = self.connection_method == 'max'
-
-        new_xysv = grow_connection_blend(
-            caf_f, xyv[0], xyv[1], xy_scale_s, only_max)
-        if new_xysv[3] == 0.0:
-            return 0.0, 0.0, 0.0, 0.0
-        keypoint_score = np.sqrt(new_xysv[3] * xyv[2])  # geometric mean
-        if keypoint_score < self.keypoint_threshold:
-            return 0.0, 0.0, 0.0, 0.0
-        if keypoint_score < xyv[2] * self.keypoint_threshold_rel:
-            return 0.0, 0.0, 0.0, 0.0
-        xy_scale_t = max(0.0, new_xysv[2])
-
-        # reverse match
-        if self.reverse_match and reverse_match:
-            reverse_xyv = grow_connection_blend(
-                caf_b, new_xysv[0], new_xysv[1], xy_scale_t, only_max)
-            if reverse_xyv[2] == 0.0:
-                return 0.0, 0.0, 0.0, 0.0
-            if abs(xyv[0] - reverse_xyv[0]) + abs(xyv[1] - reverse_xyv[1]) > xy_scale_s:
-                return 0.0, 0.0, 0.0, 0.0
-
-        return (new_xysv[0], new_xysv[1], new_xysv[2], keypoint_score)
+
+        return connection_value(
+            caf_f, caf_b, ann.data, ann.joint_scales, start_i,
+            only_max=self._only_max,
+            keypoint_threshold=self.keypoint_threshold,
+            keypoint_threshold_rel=self.keypoint_threshold_rel,
+            reverse_match=self.reverse_match and reverse_match,
+            reverse_match_skip_ratio=self._reverse_match_skip_ratio,
+            reverse_match_skip_max_scale=self.reverse_match_skip_max_scale,
+        )
 
     @staticmethod
     def p2p_value(source_xyv, caf_scored, source_s, target_xysv, caf_i, forward):
-        # TODO move to Cython (see grow_connection_blend)
         caf_f, _ = caf_scored.directed(caf_i, forward)
-        xy_scale_s = max(0.0, source_s)
-
-        # source value
-        caf_field = caf_center_s(caf_f, source_xyv[0], source_xyv[1],
-                                 sigma=2.0 * xy_scale_s)
-        if caf_field.shape[1] == 0:
-            return 0.0
-
-        # distances
-        d_source = np.linalg.norm(
-            ((source_xyv[0],), (source_xyv[1],)) - caf_field[1:3], axis=0)
-        d_target = np.linalg.norm(
-            ((target_xysv[0],), (target_xysv[1],)) - caf_field[5:7], axis=0)
-
-        # combined value and source distance
-        xy_scale_t = max(0.0, target_xysv[2])
-        sigma_s = 0.5 * xy_scale_s
-        sigma_t = 0.5 * xy_scale_t
-        scores = (
-            np.exp(-0.5 * d_source**2 / sigma_s**2)
-            * np.exp(-0.5 * d_target**2 / sigma_t**2)
-            * caf_field[0]
+        return p2p_value(
+            caf_f,
+            source_xyv[0], source_xyv[1], source_xyv[2], max(0.0, source_s),
+            target_xysv[0], target_xysv[1], max(0.0, target_xysv[2]),
         )
-        return np.sqrt(source_xyv[2] * max(scores))
 
     def _grow(self, ann, caf_scored, *, reverse_match=True):
-        frontier = []
-        in_frontier = set()
+        if self.frontier_buckets:
+            frontier = BucketedFrontier(len(ann.data), self.frontier_buckets)
+        else:
+            frontier = Frontier(len(ann.data))
+        frontier_order = ann.frontier_order if self.record_decoding_order else None
 
         def add_to_frontier(start_i):
-            for end_i, (caf_i, _) in self.by_source[start_i].items():
-                if ann.data[end_i, 2] > 0.0:
-                    continue
-                if (start_i, end_i) in in_frontier:
-                    continue
-
-                max_possible_score = np.sqrt(ann.data[start_i, 2])
-                if self.confidence_scales is not None:
-                    max_possible_score *= self.confidence_scales[caf_i]
-                heapq.heappush(frontier, (-max_possible_score, None, start_i, end_i))
-                in_frontier.add((start_i, end_i))
-                ann.frontier_order.append((start_i, end_i))
+            frontier.add_connections(
+                ann.data, start_i,
+                self.neighbors_ptr, self.neighbors_idx, self.caf_index,
+                self._conf_scales, frontier_order,
+            )
 
         def frontier_get():
             while frontier:
-                entry = heapq.heappop(frontier)
+                entry = frontier.pop()
                 if entry[1] is not None:
                     return entry
 
@@ -360,15 +426,16 @@ class CifCaf(Decoder):
                     continue
                 score = new_xysv[3]
                 if self.greedy:
-                    return (-score, new_xysv, start_i, end_i)
-                if self.confidence_scales is not None:
-                    caf_i, _ = self.by_source[start_i][end_i]
-                    score = score * self.confidence_scales[caf_i]
-                heapq.heappush(frontier, (-score, new_xysv, start_i, end_i))
+                    return (score, new_xysv, start_i, end_i)
+                score = score * self._conf_scales[self.caf_index[start_i, end_i]]
+                frontier.push(score, start_i, end_i, *new_xysv)
 
         # seeding the frontier
-        for joint_i in np.flatnonzero(ann.data[:, 2]):
-            add_to_frontier(joint_i)
+        frontier.add_all_connections(
+            ann.data,
+            self.neighbors_ptr, self.neighbors_idx, self.caf_index,
+            self._conf_scales, frontier_order,
+        )
 
         while True:
             entry = frontier_get()
@@ -382,33 +449,40 @@ class CifCaf(Decoder):
             ann.data[jti, :2] = new_xysv[:2]
             ann.data[jti, 2] = new_xysv[3]
             ann.joint_scales[jti] = new_xysv[2]
-            ann.decoding_order.append(
-                (jsi, jti, np.copy(ann.data[jsi]), np.copy(ann.data[jti])))
+            if self.record_decoding_order:
+                ann.decoding_order.append((jsi, jti))
             add_to_frontier(jti)
 
     def _flood_fill(self, ann):
         frontier = []
+        data = ann.data
+        joint_scales = ann.joint_scales
+        neighbors = self.neighbors
+        confidence_scales = self.confidence_scales
 
         def add_to_frontier(start_i):
-            for end_i, (caf_i, _) in self.by_source[start_i].items():
-                if ann.data[end_i, 2] > 0.0:
+            start_xyv = start_s = None
+            for end_i, caf_i in neighbors[start_i]:
+                if data[end_i, 2] > 0.0:
                     continue
-                start_xyv = ann.data[start_i].tolist()
+                if start_xyv is None:
+                    start_xyv = data[start_i].tolist()
+                    start_s = joint_scales[start_i].item()
                 score = start_xyv[2]
-                if self.confidence_scales is not None:
-                    score = score * self.confidence_scales[caf_i]
-                heapq.heappush(frontier, (-score, end_i, start_xyv, ann.joint_scales[start_i]))
+                if confidence_scales is not None:
+                    score = score * confidence_scales[caf_i]
+                heapq.heappush(frontier, (-score, end_i, start_xyv, start_s))
 
-        for start_i in np.flatnonzero(ann.data[:, 2]):
+        for start_i in np.flatnonzero(data[:, 2]).tolist():
             add_to_frontier(start_i)
 
         while frontier:
             _, end_i, xyv, s = heapq.heappop(frontier)
-            if ann.data[end_i, 2] > 0.0:
+            if data[end_i, 2] > 0.0:
                 continue
-            ann.data[end_i, :2] = xyv[:2]
-            ann.data[end_i, 2] = 0.00001
-            ann.joint_scales[end_i] = s
+            data[end_i, :2] = xyv[:2]
+            data[end_i, 2] = 0.00001
+            joint_scales[end_i] = s
             add_to_frontier(end_i)
 
     def complete_annotations(self, cifhr, fields, annotations):
@@ -418,13 +492,24 @@ class CifCaf(Decoder):
             caf_scored = (utils
                           .CafScored(cifhr.accumulated, score_th=self.force_complete_caf_th)
                           .fill(fields, self.caf_metas))
-            for ann in annotations:
+
+            def complete(ann):
                 unfilled_mask = ann.data[:, 2] == 0.0
                 self._grow(ann, caf_scored, reverse_match=False)
                 now_filled_mask = ann.data[:, 2] > 0.0
                 updated = np.logical_and(unfilled_mask, now_filled_mask)
                 ann.data[updated, 2] = np.minimum(0.001, ann.data[updated, 2])
 
+            # Annotations are completed independently of each other. The CAF
+            # evaluations release the GIL, so threads run them in parallel.
+            if self.complete_threads and len(annotations) >= 4:
+                with concurrent.futures.ThreadPoolExecutor(self.complete_threads) as executor:
+                    for _ in executor.map(complete, annotations):
+                        pass
+            else:
+                for ann in annotations:
+                    complete(ann)
+
         # some joints might still be unfilled
         for ann in annotations:
             self._flood_fill(ann)
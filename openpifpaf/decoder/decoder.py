@@ -25,6 +25,7 @@ class Decoder:
     When creating a new generator, the main implementation goes into `__call__()`.
     """
     default_worker_pool = None
+    fields_fp16 = False
 
     def __init__(self):
         self.priority = 0.0  # reference priority for single image CifCaf
@@ -73,9 +74,13 @@ class Decoder:
             if k not in ('worker_pool',)
         }
 
-    @staticmethod
-    def fields_batch(model, image_batch, *, device=None):
-        """From image batch to field batch."""
+    @classmethod
+    def fields_batch(cls, model, image_batch, *, device=None):
+        """From image batch to field batch.
+
+        With fields_fp16, the fields are transferred from the device and
+        passed to the decoders as float16.
+        """
         start = time.time()
 
         def apply(f, items):
@@ -95,6 +100,8 @@ class Decoder:
 
             # to numpy
             with torch.autograd.profiler.record_function('tonumpy'):
+                if cls.fields_fp16:
+                    heads = apply(lambda x: x.half(), heads)
                 heads = apply(lambda x: x.cpu().numpy(), heads)
 
         # index by frame (item in batch)
@@ -31,6 +31,8 @@ def cli(parser, *, workers=None):
                        help='number of workers for pose decoding')
     group.add_argument('--caf-seeds', default=False, action='store_true',
                        help='[experimental]')
+    group.add_argument('--decoder-fp16-fields', default=False, action='store_true',
+                       help='transfer fields as float16 to the decoder')
 
     group.add_argument('--profile-decoder', nargs='?', const='profile_decoder.prof', default=None,
                        help='specify out .prof file or nothing for default file name')
@@ -72,6 +74,7 @@ def configure(args):
 
     # configure generators
     Decoder.default_worker_pool = args.decoder_workers
+    Decoder.fields_fp16 = args.decoder_fp16_fields
 
     # configure nms
     utils.nms.Detection.instance_threshold = args.instance_threshold
@@ -5,7 +5,7 @@ from typing import List
 import numpy as np
 
 # pylint: disable=import-error
-from ...functional import scalar_values
+from ...functional import scalar_values_multi
 from ... import headmeta
 
 LOG = logging.getLogger(__name__)
@@ -29,53 +29,94 @@ class CafScored:
 
         return self.backward[caf_i], self.forward[caf_i]
 
-    def rescore(self, nine, joint_t):
-        if self.cif_floor < 1.0 and joint_t < len(self.cifhr) and not self.ablation_no_rescore:
-            cifhr_t = scalar_values(self.cifhr[joint_t], nine[3], nine[4], default=0.0)
-            nine[0] = nine[0] * (self.cif_floor + (1.0 - self.cif_floor) * cifhr_t)
-        return nine[:, nine[0] > self.score_th]
+    def rescore_multi(self, nine, joint_t):
+        """Rescore with the cifhr value of the target joint of every column.
+
+        Returns the mask of columns above the score threshold.
+        """
+        if self.cif_floor < 1.0 and not self.ablation_no_rescore:
+            cifhr_t = scalar_values_multi(self.cifhr, joint_t, nine[3], nine[4], default=0.0)
+            rescore_mask = joint_t < len(self.cifhr)
+            if np.all(rescore_mask):
+                nine[0] = nine[0] * (self.cif_floor + (1.0 - self.cif_floor) * cifhr_t)
+            else:
+                nine[0, rescore_mask] = nine[0, rescore_mask] * (
+                    self.cif_floor + (1.0 - self.cif_floor) * cifhr_t[rescore_mask])
+        return nine[0] > self.score_th
 
     def fill_single(self, all_fields, meta: headmeta.Caf):
+        """Fill from the CAF field of meta.
+
+        The field can also be given as a list of parts that are
+        concatenated along the field axis, e.g. for a concatenated meta.
+        """
         start = time.perf_counter()
-        caf = all_fields[meta.head_index]
+        cafs = all_fields[meta.head_index]
+        if not isinstance(cafs, (list, tuple)):
+            cafs = [cafs]
 
         if self.forward is None:
-            self.forward = [np.empty((9, 0), dtype=caf.dtype) for _ in caf]
-            self.backward = [np.empty((9, 0), dtype=caf.dtype) for _ in caf]
+            n_cafs = sum(len(caf) for caf in cafs)
+            self.forward = [np.empty((9, 0), dtype=np.float32) for _ in range(n_cafs)]
+            self.backward = [np.empty((9, 0), dtype=np.float32) for _ in range(n_cafs)]
+
+        skeleton_m1 = np.asarray(meta.skeleton, dtype=np.intp) - 1
+        caf_offset = 0
+        for caf in cafs:
+            self._fill_part(caf, meta, skeleton_m1, caf_offset)
+            caf_offset += len(caf)
 
-        for caf_i, nine in enumerate(caf):
+        LOG.debug('scored caf (%d, %d) in %.3fs',
+                  sum(f.shape[1] for f in self.forward),
+                  sum(b.shape[1] for b in self.backward),
+                  time.perf_counter() - start)
+        return self
+
+    def _fill_part(self, caf, meta: headmeta.Caf, skeleton_m1, caf_offset):
+        # one field at a time keeps the temporary arrays small at low thresholds
+        for caf_i, nine in enumerate(caf, start=caf_offset):
             assert nine.shape[0] == 9
 
             mask = nine[0] > self.score_th
             if not np.any(mask):
                 continue
-            nine = nine[:, mask]
+            # fields can be float16, upcast only the selected columns
+            nine = nine[:, mask].astype(np.float32, copy=False)
 
             if meta.decoder_min_distance:
-                dist = np.linalg.norm(nine[1:3] - nine[3:5], axis=0)
+                dist = self._distance(nine)
                 mask_dist = dist > meta.decoder_min_distance / meta.stride
-                nine = nine[:, mask_dist]
+                if not np.all(mask_dist):
+                    nine = nine[:, mask_dist]
 
             if meta.decoder_max_distance:
-                dist = np.linalg.norm(nine[1:3] - nine[3:5], axis=0)
+                dist = self._distance(nine)
                 mask_dist = dist < meta.decoder_max_distance / meta.stride
-                nine = nine[:, mask_dist]
-
-            nine[(1, 2, 3, 4, 5, 6, 7, 8), :] *= meta.stride
-
-            nine_b = np.copy(nine[(0, 3, 4, 1, 2, 6, 5, 8, 7), :])
-            nine_b = self.rescore(nine_b, meta.skeleton[caf_i][0] - 1)
-            self.backward[caf_i] = np.concatenate((self.backward[caf_i], nine_b), axis=1)
-
-            nine_f = np.copy(nine)
-            nine_f = self.rescore(nine_f, meta.skeleton[caf_i][1] - 1)
-            self.forward[caf_i] = np.concatenate((self.forward[caf_i], nine_f), axis=1)
-
-        LOG.debug('scored caf (%d, %d) in %.3fs',
-                  sum(f.shape[1] for f in self.forward),
-                  sum(b.shape[1] for b in self.backward),
-                  time.perf_counter() - start)
-        return self
+                if not np.all(mask_dist):
+                    nine = nine[:, mask_dist]
+
+            nine[1:] *= meta.stride
+
+            nine_b = nine[(0, 3, 4, 1, 2, 6, 5, 8, 7), :]
+            mask_b = self.rescore_multi(
+                nine_b, np.full((nine_b.shape[1],), skeleton_m1[caf_i, 0], dtype=np.intp))
+            self._append(self.backward, caf_i, nine_b[:, mask_b])
+
+            mask_f = self.rescore_multi(
+                nine, np.full((nine.shape[1],), skeleton_m1[caf_i, 1], dtype=np.intp))
+            self._append(self.forward, caf_i, nine[:, mask_f])
+
+    @staticmethod
+    def _distance(nine):
+        """Same as np.linalg.norm(nine[1:3] - nine[3:5], axis=0) without the 2D temporaries."""
+        return np.sqrt(np.square(nine[1] - nine[3]) + np.square(nine[2] - nine[4]))
+
+    @staticmethod
+    def _append(directed, caf_i, nine):
+        if directed[caf_i].shape[1] == 0:
+            directed[caf_i] = nine
+            return
+        directed[caf_i] = np.concatenate((directed[caf_i], nine), axis=1)
 
     def fill(self, all_fields, metas: List[headmeta.Caf]):
         for meta in metas:
@@ -4,7 +4,7 @@ import time
 import numpy as np
 
 # pylint: disable=import-error
-from ...functional import scalar_square_add_gauss_with_max
+from ...functional import scalar_square_add_gauss_with_max_multi
 from ... import visualizer
 
 LOG = logging.getLogger(__name__)
@@ -19,14 +19,26 @@ class CifHr:
 
     def __init__(self):
         self.accumulated = None
+        self._reusable = None
+
+    def reset(self):
+        """Start a new image and keep the memory of the previous accumulation."""
+        self._reusable = self.accumulated
+        self.accumulated = None
+        return self
 
     def fill_single(self, all_fields, meta):
         return self.fill(all_fields, [meta])
 
-    def accumulate(self, len_cifs, t, p, stride, min_scale):
-        p = p[:, p[0] > self.v_threshold]
+    def accumulate_multi(self, len_cifs, ta, fields, stride, min_scale):
+        """Accumulate all fields of one head with a single call into the Cython kernel."""
+        mask = fields[:, 0] > self.v_threshold
+        f = np.nonzero(mask)[0]
+        p = np.moveaxis(fields, 1, 0)[:, mask].astype(np.float32, copy=False)
         if min_scale:
-            p = p[:, p[4] > min_scale / stride]
+            mask_scale = p[4] > min_scale / stride
+            f = f[mask_scale]
+            p = p[:, mask_scale]
 
         v, x, y, _, scale = p
         x = x * stride
@@ -36,8 +48,8 @@ class CifHr:
         # Occupancy covers 2sigma.
         # Restrict this accumulation to 1sigma so that seeds for the same joint
         # are properly suppressed.
-        scalar_square_add_gauss_with_max(
-            t, x, y, sigma, v / self.neighbors / len_cifs, truncate=1.0)
+        scalar_square_add_gauss_with_max_multi(
+            ta, f, x, y, sigma, v / self.neighbors / len_cifs, truncate=1.0)
 
     def fill(self, all_fields, metas):
         start = time.perf_counter()
@@ -49,14 +61,19 @@ class CifHr:
                 int((field_shape[2] - 1) * metas[0].stride + 1),
                 int((field_shape[3] - 1) * metas[0].stride + 1),
             )
-            ta = np.zeros(shape, dtype=np.float32)
+            if self._reusable is not None and self._reusable.shape == shape:
+                ta = self._reusable
+                ta.fill(0.0)
+            else:
+                ta = np.zeros(shape, dtype=np.float32)
+            self._reusable = None
         else:
             ta = np.zeros(self.accumulated.shape, dtype=np.float32)
 
         if not self.ablation_skip:
             for meta in metas:
-                for t, p in zip(ta, all_fields[meta.head_index]):
-                    self.accumulate(len(metas), t, p, meta.stride, meta.decoder_min_scale)
+                self.accumulate_multi(len(metas), ta, all_fields[meta.head_index],
+                                      meta.stride, meta.decoder_min_scale)
 
         if self.accumulated is None:
             self.accumulated = ta
@@ -69,11 +86,14 @@ class CifHr:
 
 
 class CifDetHr(CifHr):
-    def accumulate(self, len_cifs, t, p, stride, min_scale):
-        p = p[:, p[0] > self.v_threshold]
+    def accumulate_multi(self, len_cifs, ta, fields, stride, min_scale):
+        mask = fields[:, 0] > self.v_threshold
+        f = np.nonzero(mask)[0]
+        p = np.moveaxis(fields, 1, 0)[:, mask].astype(np.float32, copy=False)
         if min_scale:
-            p = p[:, p[4] > min_scale / stride]
-            p = p[:, p[5] > min_scale / stride]
+            mask_scale = np.logical_and(p[4] > min_scale / stride, p[5] > min_scale / stride)
+            f = f[mask_scale]
+            p = p[:, mask_scale]
 
         v, x, y, w, h, _, __ = p
         x = x * stride
@@ -83,5 +103,5 @@ class CifDetHr(CifHr):
         # Occupancy covers 2sigma.
         # Restrict this accumulation to 1sigma so that seeds for the same joint
         # are properly suppressed.
-        scalar_square_add_gauss_with_max(
-            t, x, y, sigma, v / self.neighbors / len_cifs, truncate=1.0)
+        scalar_square_add_gauss_with_max_multi(
+            ta, f, x, y, sigma, v / self.neighbors / len_cifs, truncate=1.0)
@@ -1,6 +1,7 @@
 import logging
 import time
 
+import numpy as np
 import torch
 
 # pylint: disable=import-error
@@ -20,7 +21,10 @@ class CifSeeds:
 
     def __init__(self, cifhr: CifHr):
         self.cifhr = cifhr
-        self.seeds = []
+        # structure of arrays: one chunk of field indices and one chunk of
+        # (v, x, y, s) rows per field
+        self.seeds_f = []
+        self.seeds_vxys = []
 
     def fill(self, all_fields, metas):
         for meta in metas:
@@ -38,7 +42,7 @@ class CifSeeds:
         for field_i, p in enumerate(cif):
             if meta.decoder_seed_mask is not None and not meta.decoder_seed_mask[field_i]:
                 continue
-            p = p[:, p[0] > self.threshold]
+            p = p[:, p[0] > self.threshold].astype(np.float32, copy=False)
             if meta.decoder_min_scale:
                 p = p[:, p[4] > meta.decoder_min_scale / meta.stride]
             c, x, y, _, s = p
@@ -58,15 +62,35 @@ class CifSeeds:
             m = v > self.threshold
             x, y, v, s = x[m] * meta.stride, y[m] * meta.stride, v[m], s[m] * meta.stride
 
-            for vv, xx, yy, ss in zip(v, x, y, s):
-                self.seeds.append((vv, field_i, xx, yy, ss))
+            self.seeds_f.append(np.full((len(v),), field_i, dtype=np.int64))
+            self.seeds_vxys.append(np.stack((v, x, y, s), axis=1).astype(np.float32, copy=False))
 
-        LOG.debug('seeds %d, %.3fs (C++ %.3fs)', len(self.seeds), time.perf_counter() - start, sv)
+        LOG.debug('seeds %d, %.3fs (C++ %.3fs)',
+                  sum(len(f) for f in self.seeds_f), time.perf_counter() - start, sv)
         return self
 
     def get(self):
-        self.debug_visualizer.predicted(self.seeds)
-        return sorted(self.seeds, reverse=True)
+        """Seeds as (v, f, x, y, s) tuples sorted in descending order."""
+        f, vxys = self.get_arrays()
+        return [(v, ff, x, y, s) for ff, (v, x, y, s) in zip(f.tolist(), vxys.tolist())]
+
+    def get_arrays(self):
+        """Seeds as field indices of shape (N,) and vxys of shape (N, 4).
+
+        Sorted in descending order of (v, f, x, y, s).
+        """
+        if not self.seeds_f:
+            return np.zeros((0,), dtype=np.int64), np.zeros((0, 4), dtype=np.float32)
+
+        f = np.concatenate(self.seeds_f)
+        vxys = np.concatenate(self.seeds_vxys)
+        order = np.lexsort((vxys[:, 3], vxys[:, 2], vxys[:, 1], f, vxys[:, 0]))[::-1]
+        f, vxys = f[order], vxys[order]
+
+        if self.debug_visualizer.indices():
+            self.debug_visualizer.predicted([
+                (vv, ff, xx, yy, ss) for ff, (vv, xx, yy, ss) in zip(f, vxys)])
+        return f, vxys
 
     @staticmethod
     def nms(cif):
@@ -83,12 +107,21 @@ class CifSeeds:
 
 
 class CifDetSeeds(CifSeeds):
+    def __init__(self, cifhr: CifHr):  # pylint: disable=super-init-not-called
+        # detection seeds are kept as tuples instead of the arrays of CifSeeds
+        self.cifhr = cifhr
+        self.seeds = []
+
+    def get(self):
+        self.debug_visualizer.predicted(self.seeds)
+        return sorted(self.seeds, reverse=True)
+
     def fill_single(self, all_fields, meta: headmeta.CifDet):
         start = time.perf_counter()
 
         cif = all_fields[meta.head_index]
         for field_i, p in enumerate(cif):
-            p = p[:, p[0] > self.threshold]
+            p = p[:, p[0] > self.threshold].astype(np.float32, copy=False)
             if meta.decoder_min_scale:
                 p = p[:, p[4] > meta.decoder_min_scale / meta.stride]
                 p = p[:, p[5] > meta.decoder_min_scale / meta.stride]
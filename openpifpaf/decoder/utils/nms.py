@@ -16,12 +16,22 @@ class Keypoints:
     keypoint_threshold = 0.15
     occupancy_visualizer = None
 
+    def _filter_sorted(self, anns):
+        """Annotations above the instance threshold in descending order of score.
+
+        Every score is computed only once.
+        """
+        scores = [ann.score for ann in anns]
+        indices = [i for i, score in enumerate(scores) if score >= self.instance_threshold]
+        indices.sort(key=lambda i: -scores[i])
+        return [anns[i] for i in indices]
+
     def annotations(self, anns):
         start = time.perf_counter()
 
         for ann in anns:
             ann.data[ann.data[:, 2] < self.keypoint_threshold] = 0.0
-        anns = [ann for ann in anns if ann.score >= self.instance_threshold]
+        anns = self._filter_sorted(anns)
 
         if not anns:
             return anns
@@ -33,19 +43,11 @@ class Keypoints:
         shape = (len(anns[0].data), max(1, max_y + 1), max(1, max_x + 1))
         occupied = Occupancy(shape, 2, min_scale=4)
 
-        anns = sorted(anns, key=lambda a: -a.score)
         for ann in anns:
             assert ann.joint_scales is not None
             assert len(occupied) == len(ann.data)
-            for f, (xyv, joint_s) in enumerate(zip(ann.data, ann.joint_scales)):
-                v = xyv[2]
-                if v == 0.0:
-                    continue
-
-                if occupied.get(f, xyv[0], xyv[1]):
-                    xyv[2] *= self.suppression
-                else:
-                    occupied.set(f, xyv[0], xyv[1], joint_s)  # joint_s = 2 * sigma
+            # joint_scales = 2 * sigma
+            occupied.suppress_keypoints(ann.data, ann.joint_scales, self.suppression)
 
         if self.occupancy_visualizer is not None:
             LOG.debug('Occupied fields after NMS')
@@ -53,8 +55,7 @@ class Keypoints:
 
         for ann in anns:
             ann.data[ann.data[:, 2] < self.keypoint_threshold] = 0.0
-        anns = [ann for ann in anns if ann.score >= self.instance_threshold]
-        anns = sorted(anns, key=lambda a: -a.score)
+        anns = self._filter_sorted(anns)
 
         LOG.debug('nms = %.3fs', time.perf_counter() - start)
         return anns
@@ -1,9 +1,17 @@
 # cython: infer_types=True
 cimport cython
-from libc.math cimport exp, fabs, sqrt, fmin, fmax
+from cython cimport floating
+from libc.math cimport exp, fabs, sqrt, fmin, fmax, INFINITY
+from libc.stdlib cimport calloc, free, malloc, realloc
 import numpy as np
 
 
+# independent of floating so that keypoints and scales can have different dtypes
+ctypedef fused scale_floating:
+    float
+    double
+
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
 cpdef void scalar_square_add_constant(float[:, :] field, float[:] x, float[:] y, float[:] width, float[:] v) nogil:
@@ -64,17 +72,30 @@ cdef class Occupancy:
         self.reduction = reduction
         self.min_scale_reduced = min_scale / reduction
 
-        self.occupancy = np.zeros((
-            shape[0],
-            int(shape[1] / reduction) + 1,
-            int(shape[2] / reduction) + 1,
-        ), dtype=np.uint8)
+        self.occupancy = np.zeros(self._reduced_shape(shape), dtype=np.uint8)
         self.occupancy_view = self.occupancy
         # LOG.debug('shape = %s, min_scale = %d', self.occupancy.shape, self.min_scale_reduced)
 
+    def _reduced_shape(self, shape):
+        return (
+            shape[0],
+            int(shape[1] / self.reduction) + 1,
+            int(shape[2] / self.reduction) + 1,
+        )
+
     def __len__(self):
         return len(self.occupancy)
 
+    def reset(self, shape=None):
+        """Clear all fields and keep the memory unless a different shape is given."""
+        if shape is not None and self.occupancy.shape != self._reduced_shape(shape):
+            self.occupancy = np.zeros(self._reduced_shape(shape), dtype=np.uint8)
+            self.occupancy_view = self.occupancy
+            return self
+
+        self.occupancy.fill(0)
+        return self
+
     cpdef public set(self, long f, float x, float y, float sigma):
         """Setting needs to be centered at the rounded (x, y)."""
         if f >= len(self.occupancy):
@@ -83,6 +104,33 @@ cdef class Occupancy:
         scalar_square_set(self.occupancy_view[f], x, y, sigma,
                           reduction=self.reduction, min_sigma=self.min_scale_reduced)
 
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def set_keypoints(self, floating[:, :] data, scale_floating[:] scales):
+        """Same as set() for every keypoint (x, y, v) in data with v != 0."""
+        cdef Py_ssize_t f, n_fields = self.occupancy_view.shape[0]
+
+        for f in range(min(data.shape[0], n_fields)):
+            if data[f, 2] == 0.0:
+                continue
+            scalar_square_set(self.occupancy_view[f], data[f, 0], data[f, 1], scales[f],
+                              reduction=self.reduction, min_sigma=self.min_scale_reduced)
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def suppress_keypoints(self, floating[:, :] data, scale_floating[:] scales, float suppression):
+        """Same as test_and_set() for every keypoint (x, y, v) in data with v != 0.
+
+        The confidence v of an already occupied keypoint is multiplied by suppression.
+        """
+        cdef Py_ssize_t f
+
+        for f in range(data.shape[0]):
+            if data[f, 2] == 0.0:
+                continue
+            if self.test_and_set(f, data[f, 0], data[f, 1], scales[f]):
+                data[f, 2] = data[f, 2] * suppression
+
     cpdef readonly unsigned char get(self, long f, float x, float y):
         """Getting needs to be done at the floor of (x, y)."""
         if f >= len(self.occupancy):
@@ -91,9 +139,295 @@ cdef class Occupancy:
         # floor is done in scalar_nonzero_clipped below
         return scalar_nonzero_clipped_with_reduction(self.occupancy_view[f], x, y, self.reduction)
 
+    cpdef unsigned char test_and_set(self, long f, float x, float y, float sigma):
+        """Set (x, y) unless it is occupied already and return the previous state.
+
+        Equivalent to a get() followed by a set() when get() returned zero.
+        """
+        if f >= len(self.occupancy):
+            return 1
 
+        if scalar_nonzero_clipped_with_reduction(self.occupancy_view[f], x, y, self.reduction):
+            return 1
+        scalar_square_set(self.occupancy_view[f], x, y, sigma,
+                          reduction=self.reduction, min_sigma=self.min_scale_reduced)
+        return 0
 
 
+ctypedef struct FrontierEntry:
+    double score
+    bint evaluated
+    double xysv[4]
+    long start_i
+    long end_i
+
+
+cdef inline bint frontier_entry_before(FrontierEntry* a, FrontierEntry* b) noexcept nogil:
+    """Order of (-score, xysv, start_i, end_i) tuples in a min-heap."""
+    cdef Py_ssize_t i
+
+    if a.score != b.score:
+        return a.score > b.score
+    if a.evaluated != b.evaluated:
+        return a.evaluated
+    if a.evaluated:
+        for i in range(4):
+            if a.xysv[i] != b.xysv[i]:
+                return a.xysv[i] < b.xysv[i]
+    if a.start_i != b.start_i:
+        return a.start_i < b.start_i
+    return a.end_i < b.end_i
+
+
+cdef class Frontier:
+    """Max-heap of connections from decoded to not yet decoded joints.
+
+    Entries are candidates (start_i, end_i) with an upper bound on their score
+    or evaluated connections that carry the new keypoint (x, y, s, v).
+    """
+    cdef Py_ssize_t n_keypoints
+    cdef Py_ssize_t size
+    cdef Py_ssize_t capacity
+    cdef FrontierEntry* entries
+    cdef unsigned char* in_frontier
+
+    def __cinit__(self, Py_ssize_t n_keypoints, *args):
+        self.n_keypoints = n_keypoints
+        self.size = 0
+        self.capacity = 64
+        self.entries = <FrontierEntry*> malloc(self.capacity * sizeof(FrontierEntry))
+        self.in_frontier = <unsigned char*> calloc(n_keypoints * n_keypoints, sizeof(unsigned char))
+        if self.entries == NULL or self.in_frontier == NULL:
+            raise MemoryError()
+
+    def __dealloc__(self):
+        free(self.entries)
+        free(self.in_frontier)
+
+    def __len__(self):
+        return self.size
+
+    cdef FrontierEntry* _new_entry(self) except NULL:
+        cdef FrontierEntry* entries
+        if self.size == self.capacity:
+            entries = <FrontierEntry*> realloc(
+                self.entries, 2 * self.capacity * sizeof(FrontierEntry))
+            if entries == NULL:
+                raise MemoryError()
+            self.entries = entries
+            self.capacity *= 2
+        self.size += 1
+        return &self.entries[self.size - 1]
+
+    cdef void _sift_up(self, Py_ssize_t i) noexcept nogil:
+        cdef FrontierEntry entry = self.entries[i]
+        cdef Py_ssize_t parent
+        while i > 0:
+            parent = (i - 1) >> 1
+            if not frontier_entry_before(&entry, &self.entries[parent]):
+                break
+            self.entries[i] = self.entries[parent]
+            i = parent
+        self.entries[i] = entry
+
+    cdef void _sift_down(self, Py_ssize_t i) noexcept nogil:
+        cdef FrontierEntry entry = self.entries[i]
+        cdef Py_ssize_t child
+        while True:
+            child = 2 * i + 1
+            if child >= self.size:
+                break
+            if (child + 1 < self.size
+                    and frontier_entry_before(&self.entries[child + 1], &self.entries[child])):
+                child += 1
+            if not frontier_entry_before(&self.entries[child], &entry):
+                break
+            self.entries[i] = self.entries[child]
+            i = child
+        self.entries[i] = entry
+
+    cdef int _insert(self, FrontierEntry* entry) except -1:
+        cdef FrontierEntry* new_entry = self._new_entry()
+        new_entry[0] = entry[0]
+        self._sift_up(self.size - 1)
+        return 0
+
+    cdef FrontierEntry _pop_entry(self):
+        cdef FrontierEntry entry = self.entries[0]
+        self.size -= 1
+        if self.size > 0:
+            self.entries[0] = self.entries[self.size]
+            self._sift_down(0)
+        return entry
+
+    cpdef bint add(self, double score, long start_i, long end_i) except -1:
+        """Add a candidate connection unless it was added before."""
+        if not (0 <= start_i < self.n_keypoints and 0 <= end_i < self.n_keypoints):
+            raise IndexError('connection ({}, {}) out of range for {} keypoints'.format(
+                start_i, end_i, self.n_keypoints))
+
+        cdef Py_ssize_t key = start_i * self.n_keypoints + end_i
+        if self.in_frontier[key]:
+            return False
+        self.in_frontier[key] = 1
+
+        cdef FrontierEntry entry
+        entry.score = score
+        entry.evaluated = False
+        entry.start_i = start_i
+        entry.end_i = end_i
+        self._insert(&entry)
+        return True
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef void _add_connections(self, floating[:, :] data, long start_i,
+                               int[:] neighbors_ptr, int[:] neighbors_idx, short[:, :] caf_index,
+                               float[:] confidence_scales, list frontier_order) except *:
+        cdef float max_possible_score = sqrt(data[start_i, 2])
+        cdef float score
+        cdef long end_i
+        cdef Py_ssize_t p
+
+        for p in range(neighbors_ptr[start_i], neighbors_ptr[start_i + 1]):
+            end_i = neighbors_idx[p]
+            if data[end_i, 2] > 0.0:
+                continue
+
+            score = max_possible_score * confidence_scales[caf_index[start_i, end_i]]
+            if self.add(score, start_i, end_i) and frontier_order is not None:
+                frontier_order.append((start_i, end_i))
+
+    def add_connections(self, floating[:, :] data, long start_i,
+                        int[:] neighbors_ptr, int[:] neighbors_idx, short[:, :] caf_index,
+                        float[:] confidence_scales, list frontier_order=None):
+        """Add candidates from start_i to all neighbors that have no keypoint yet.
+
+        The neighbors of joint j are neighbors_idx[neighbors_ptr[j]:neighbors_ptr[j + 1]].
+        """
+        self._add_connections(data, start_i, neighbors_ptr, neighbors_idx, caf_index,
+                              confidence_scales, frontier_order)
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def add_all_connections(self, floating[:, :] data,
+                            int[:] neighbors_ptr, int[:] neighbors_idx, short[:, :] caf_index,
+                            float[:] confidence_scales, list frontier_order=None):
+        """Same as add_connections() for every joint that has a keypoint."""
+        cdef long start_i
+        for start_i in range(data.shape[0]):
+            if data[start_i, 2] == 0.0:
+                continue
+            self._add_connections(data, start_i, neighbors_ptr, neighbors_idx, caf_index,
+                                  confidence_scales, frontier_order)
+
+    cpdef void push(self, double score, long start_i, long end_i,
+                    double x, double y, double s, double v) except *:
+        """Push an evaluated connection with its new keypoint."""
+        cdef FrontierEntry entry
+        entry.score = score
+        entry.evaluated = True
+        entry.xysv[0] = x
+        entry.xysv[1] = y
+        entry.xysv[2] = s
+        entry.xysv[3] = v
+        entry.start_i = start_i
+        entry.end_i = end_i
+        self._insert(&entry)
+
+    def pop(self):
+        """Pop the highest scoring entry as (score, xysv or None, start_i, end_i)."""
+        if self.size == 0:
+            return None
+
+        cdef FrontierEntry entry = self._pop_entry()
+        if not entry.evaluated:
+            return entry.score, None, entry.start_i, entry.end_i
+        return (
+            entry.score,
+            (entry.xysv[0], entry.xysv[1], entry.xysv[2], entry.xysv[3]),
+            entry.start_i,
+            entry.end_i,
+        )
+
+
+cdef class BucketedFrontier(Frontier):
+    """Approximate Frontier that sorts entries into buckets of equal score width.
+
+    Push and pop take constant time. Entries are popped from the highest
+    non-empty bucket, and within a bucket the last added entry comes first.
+    Scores are expected in [0, 1].
+    """
+    cdef Py_ssize_t n_buckets
+    cdef Py_ssize_t top_bucket
+    cdef Py_ssize_t n_slots
+    cdef Py_ssize_t free_slot
+    cdef Py_ssize_t* bucket_head
+    cdef Py_ssize_t* next_slot
+
+    def __cinit__(self, Py_ssize_t n_keypoints, Py_ssize_t n_buckets=256):
+        self.n_buckets = max(1, n_buckets)
+        self.top_bucket = -1
+        self.n_slots = 0
+        self.free_slot = -1
+        self.bucket_head = <Py_ssize_t*> malloc(self.n_buckets * sizeof(Py_ssize_t))
+        self.next_slot = <Py_ssize_t*> malloc(self.capacity * sizeof(Py_ssize_t))
+        if self.bucket_head == NULL or self.next_slot == NULL:
+            raise MemoryError()
+        for b in range(self.n_buckets):
+            self.bucket_head[b] = -1
+
+    def __dealloc__(self):
+        free(self.bucket_head)
+        free(self.next_slot)
+
+    cdef int _insert(self, FrontierEntry* entry) except -1:
+        cdef Py_ssize_t slot, bucket
+        cdef FrontierEntry* entries
+        cdef Py_ssize_t* next_slot
+
+        if self.free_slot >= 0:
+            slot = self.free_slot
+            self.free_slot = self.next_slot[slot]
+        else:
+            if self.n_slots == self.capacity:
+                entries = <FrontierEntry*> realloc(
+                    self.entries, 2 * self.capacity * sizeof(FrontierEntry))
+                if entries == NULL:
+                    raise MemoryError()
+                self.entries = entries
+                next_slot = <Py_ssize_t*> realloc(
+                    self.next_slot, 2 * self.capacity * sizeof(Py_ssize_t))
+                if next_slot == NULL:
+                    raise MemoryError()
+                self.next_slot = next_slot
+                self.capacity *= 2
+            slot = self.n_slots
+            self.n_slots += 1
+
+        bucket = 0
+        if entry.score > 0.0:
+            bucket = <Py_ssize_t>(fmin(entry.score, 1.0) * (self.n_buckets - 1))
+
+        self.entries[slot] = entry[0]
+        self.next_slot[slot] = self.bucket_head[bucket]
+        self.bucket_head[bucket] = slot
+        if bucket > self.top_bucket:
+            self.top_bucket = bucket
+        self.size += 1
+        return 0
+
+    cdef FrontierEntry _pop_entry(self):
+        while self.bucket_head[self.top_bucket] < 0:
+            self.top_bucket -= 1
+
+        cdef Py_ssize_t slot = self.bucket_head[self.top_bucket]
+        self.bucket_head[self.top_bucket] = self.next_slot[slot]
+        self.next_slot[slot] = self.free_slot
+        self.free_slot = slot
+        self.size -= 1
+        return self.entries[slot]
+
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
@@ -157,10 +491,11 @@ cpdef void scalar_square_add_gauss(float[:, :] field, float[:] x, float[:] y, fl
         maxx = (<long>clip(cx + truncate * csigma, minx + 1, field.shape[1]))
         miny = (<long>clip(cy - truncate * csigma, 0, field.shape[0] - 1))
         maxy = (<long>clip(cy + truncate * csigma, miny + 1, field.shape[0]))
-        for xx in range(minx, maxx):
-            deltax2 = (xx - cx)**2
-            for yy in range(miny, maxy):
-                deltay2 = (yy - cy)**2
+        # rows in the outer loop for contiguous memory access
+        for yy in range(miny, maxy):
+            deltay2 = (yy - cy)**2
+            for xx in range(minx, maxx):
+                deltax2 = (xx - cx)**2
 
                 if deltax2 < 0.25 and deltay2 < 0.25:
                     # this is the closest pixel
@@ -195,10 +530,11 @@ cpdef void scalar_square_add_gauss_with_max(float[:, :] field, float[:] x, float
         maxx = (<long>clip(cx + truncate_csigma + 1, minx + 1, field.shape[1]))
         miny = (<long>clip(cy - truncate_csigma, 0, field.shape[0] - 1))
         maxy = (<long>clip(cy + truncate_csigma + 1, miny + 1, field.shape[0]))
-        for xx in range(minx, maxx):
-            deltax2 = (xx - cx)**2
-            for yy in range(miny, maxy):
-                deltay2 = (yy - cy)**2
+        # rows in the outer loop for contiguous memory access
+        for yy in range(miny, maxy):
+            deltay2 = (yy - cy)**2
+            for xx in range(minx, maxx):
+                deltax2 = (xx - cx)**2
 
                 if deltax2 + deltay2 > truncate2_csigma2:
                     continue
@@ -213,6 +549,51 @@ cpdef void scalar_square_add_gauss_with_max(float[:, :] field, float[:] x, float
                 field[yy, xx] = min(max_value, field[yy, xx])
 
 
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cpdef void scalar_square_add_gauss_with_max_multi(float[:, :, :] fields, Py_ssize_t[:] f, float[:] x, float[:] y, float[:] sigma, float[:] v, float truncate=2.0, float max_value=1.0) nogil:
+    """Same as scalar_square_add_gauss_with_max() into fields[f[i]] for every i."""
+    cdef Py_ssize_t i, ff, xx, yy
+    cdef float vv, deltax2, deltay2
+    cdef float cv, cx, cy, csigma, csigma2
+    cdef long minx, miny, maxx, maxy
+    cdef float truncate2 = truncate * truncate
+    cdef float truncate_csigma, truncate2_csigma2
+
+    for i in range(x.shape[0]):
+        ff = f[i]
+        csigma = sigma[i]
+        csigma2 = csigma * csigma
+        truncate_csigma = truncate * csigma
+        truncate2_csigma2 = truncate2 * csigma2
+        cx = x[i]
+        cy = y[i]
+        cv = v[i]
+
+        minx = (<long>clip(cx - truncate_csigma, 0, fields.shape[2] - 1))
+        maxx = (<long>clip(cx + truncate_csigma + 1, minx + 1, fields.shape[2]))
+        miny = (<long>clip(cy - truncate_csigma, 0, fields.shape[1] - 1))
+        maxy = (<long>clip(cy + truncate_csigma + 1, miny + 1, fields.shape[1]))
+        # rows in the outer loop for contiguous memory access
+        for yy in range(miny, maxy):
+            deltay2 = (yy - cy)**2
+            for xx in range(minx, maxx):
+                deltax2 = (xx - cx)**2
+
+                if deltax2 + deltay2 > truncate2_csigma2:
+                    continue
+
+                if deltax2 < 0.25 and deltay2 < 0.25:
+                    # this is the closest pixel
+                    vv = cv
+                else:
+                    vv = cv * approx_exp(-0.5 * (deltax2 + deltay2) / csigma2)
+
+                fields[ff, yy, xx] += vv
+                fields[ff, yy, xx] = min(max_value, fields[ff, yy, xx])
+
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.cdivision(True)
@@ -233,10 +614,11 @@ cpdef void scalar_square_max_gauss(float[:, :] field, float[:] x, float[:] y, fl
         maxx = (<long>clip(cx + truncate * csigma, minx + 1, field.shape[1]))
         miny = (<long>clip(cy - truncate * csigma, 0, field.shape[0] - 1))
         maxy = (<long>clip(cy + truncate * csigma, miny + 1, field.shape[0]))
-        for xx in range(minx, maxx):
-            deltax2 = (xx - cx)**2
-            for yy in range(miny, maxy):
-                deltay2 = (yy - cy)**2
+        # rows in the outer loop for contiguous memory access
+        for yy in range(miny, maxy):
+            deltay2 = (yy - cy)**2
+            for xx in range(minx, maxx):
+                deltax2 = (xx - cx)**2
                 vv = cv * approx_exp(-0.5 * (deltax2 + deltay2) / csigma2)
                 field[yy, xx] = fmax(field[yy, xx], vv)
 
@@ -317,6 +699,26 @@ def scalar_values(float[:, :] field, float[:] x, float[:] y, float default=-1):
     return values_np
 
 
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def scalar_values_multi(float[:, :, :] fields, Py_ssize_t[:] f, float[:] x, float[:] y, float default=-1):
+    """Same as scalar_values() with the value i taken from fields[f[i]]."""
+    values_np = np.full((x.shape[0],), default, dtype=np.float32)
+    cdef float[:] values = values_np
+    cdef float maxx = <float>fields.shape[2] - 0.51, maxy = <float>fields.shape[1] - 0.51
+
+    for i in range(values.shape[0]):
+        if f[i] >= fields.shape[0]:
+            continue
+        if x[i] < -0.49 or y[i] < -0.49 or x[i] > maxx or y[i] > maxy:
+            continue
+
+        # effectivly rounding: int(float_value + 0.5)
+        values[i] = fields[f[i], <Py_ssize_t>(y[i] + 0.5), <Py_ssize_t>(x[i] + 0.5)]
+
+    return values_np
+
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
 cpdef float scalar_value(float[:, :] field, float x, float y, float default=-1):
@@ -438,12 +840,42 @@ def caf_center_s(float[:, :] caf_field, float x, float y, float sigma):
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.cdivision(True)
-def grow_connection_blend(float[:, :] caf_field, float x, float y, float xy_scale, bint only_max=False):
-    """Blending the top two candidates with a weighted average.
+cpdef float p2p_value(float[:, :] caf_field, float source_x, float source_y, float source_v, float source_s,
+                      float target_x, float target_y, float target_s):
+    """Value of the best connection between a given source and target."""
+    cdef float sigma_filter = 2.0 * source_s
+    cdef float sigma_s2 = 0.25 * source_s * source_s
+    cdef float sigma_t2 = 0.25 * target_s * target_s
+    cdef float d_source2, d_target2, score
+    cdef float max_score = 0.0
+    cdef Py_ssize_t i
 
-    Similar to the post processing step in
-    "BlazeFace: Sub-millisecond Neural Face Detection on Mobile GPUs".
-    """
+    for i in range(caf_field.shape[1]):
+        if caf_field[1, i] < source_x - sigma_filter:
+            continue
+        if caf_field[1, i] > source_x + sigma_filter:
+            continue
+        if caf_field[2, i] < source_y - sigma_filter:
+            continue
+        if caf_field[2, i] > source_y + sigma_filter:
+            continue
+
+        d_source2 = (source_x - caf_field[1, i])**2 + (source_y - caf_field[2, i])**2
+        d_target2 = (target_x - caf_field[5, i])**2 + (target_y - caf_field[6, i])**2
+        score = (
+            exp(-0.5 * d_source2 / sigma_s2)
+            * exp(-0.5 * d_target2 / sigma_t2)
+            * caf_field[0, i]
+        )
+        max_score = fmax(max_score, score)
+
+    return sqrt(source_v * max_score)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef inline (float, float, float, float) _grow_connection_blend(float[:, :] caf_field, float x, float y, float xy_scale, bint only_max) noexcept nogil:
     cdef float sigma_filter = 2.0 * xy_scale  # 2.0 = 4 sigma
     cdef float sigma2 = 0.25 * xy_scale * xy_scale
     cdef float d2, v, score
@@ -509,3 +941,58 @@ def grow_connection_blend(float[:, :] caf_field, float x, float y, float xy_scal
         0.5 * (score_1 + score_2),
     )
     return r
+
+
+def grow_connection_blend(float[:, :] caf_field, float x, float y, float xy_scale, bint only_max=False):
+    """Blending the top two candidates with a weighted average.
+
+    Similar to the post processing step in
+    "BlazeFace: Sub-millisecond Neural Face Detection on Mobile GPUs".
+    """
+    return _grow_connection_blend(caf_field, x, y, xy_scale, only_max)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cpdef (float, float, float, float) connection_value(
+        float[:, :] caf_f, float[:, :] caf_b,
+        floating[:, :] data, scale_floating[:] joint_scales, long start_i,
+        bint only_max=False, float keypoint_threshold=0.0, float keypoint_threshold_rel=0.0,
+        bint reverse_match=True, float reverse_match_skip_ratio=INFINITY,
+        float reverse_match_skip_max_scale=0.0):
+    """Grow from keypoint start_i along caf_f and verify with the reverse match along caf_b.
+
+    Returns the new keypoint as (x, y, s, v) or all zeros when the connection is rejected.
+    A connection that keeps more than reverse_match_skip_ratio of the source score at a
+    source scale below reverse_match_skip_max_scale is accepted without the reverse match.
+    """
+    cdef float x = data[start_i, 0], y = data[start_i, 1], v = data[start_i, 2]
+    cdef float xy_scale_s = fmax(0.0, joint_scales[start_i])
+    cdef float keypoint_score, xy_scale_t, reverse_distance
+    cdef (float, float, float, float) new_xysv, reverse_xyv
+    cdef (float, float, float, float) rejected = (0.0, 0.0, 0.0, 0.0)
+
+    with nogil:
+        new_xysv = _grow_connection_blend(caf_f, x, y, xy_scale_s, only_max)
+    if new_xysv[3] == 0.0:
+        return rejected
+    keypoint_score = sqrt(new_xysv[3] * v)  # geometric mean
+    if keypoint_score < keypoint_threshold:
+        return rejected
+    if keypoint_score < v * keypoint_threshold_rel:
+        return rejected
+    xy_scale_t = fmax(0.0, new_xysv[2])
+
+    # reverse match
+    if reverse_match and not (keypoint_score > v * reverse_match_skip_ratio
+                              and xy_scale_s < reverse_match_skip_max_scale):
+        with nogil:
+            reverse_xyv = _grow_connection_blend(
+                caf_b, new_xysv[0], new_xysv[1], xy_scale_t, only_max)
+        if reverse_xyv[2] == 0.0:
+            return rejected
+        reverse_distance = fabs(x - reverse_xyv[0]) + fabs(y - reverse_xyv[1])
+        if reverse_distance > xy_scale_s:
+            return rejected
+
+    return (new_xysv[0], new_xysv[1], new_xysv[2], keypoint_score)
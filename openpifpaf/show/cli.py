@@ -81,6 +81,13 @@ def configure(args):
     KeypointPainter.show_decoding_order = args.show_decoding_order
     KeypointPainter.show_frontier_order = args.show_frontier_order
     KeypointPainter.show_only_decoded_connections = args.show_only_decoded_connections
+    # the decoder only records what is shown
+    from .. import decoder  # pylint: disable=import-outside-toplevel,cyclic-import
+    decoder.CifCaf.record_decoding_order = (
+        args.show_decoding_order
+        or args.show_frontier_order
+        or args.show_only_decoded_connections
+    )
 
     KeypointPainter.textbox_alpha = args.textbox_alpha
     KeypointPainter.text_color = args.text_color
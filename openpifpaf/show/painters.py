@@ -361,6 +361,8 @@ class KeypointPainter(Configurable):
         y = kps[:, 1] * self.xy_scale
         v = kps[:, 2]
 
+        self._check_decoding_order(ann)
+
         if self.show_frontier_order:
             frontier = set((s, e) for s, e in ann.frontier_order)
             frontier_skeleton_mask = [
@@ -373,7 +375,7 @@ class KeypointPainter(Configurable):
 
         skeleton_mask = None
         if self.show_only_decoded_connections:
-            decoded_connections = set((jsi, jti) for jsi, jti, _, __ in ann.decoding_order)
+            decoded_connections = set((jsi, jti) for jsi, jti in ann.decoding_order)
             skeleton_mask = [
                 (s - 1, e - 1) in decoded_connections or (e - 1, s - 1) in decoded_connections
                 for s, e in ann.skeleton
@@ -396,11 +398,25 @@ class KeypointPainter(Configurable):
             self._draw_text(ax, x, y, v, text, color, subtext=subtext, alpha=alpha)
 
         if self.show_decoding_order and hasattr(ann, 'decoding_order'):
-            self._draw_decoding_order(ax, ann.decoding_order)
+            self._draw_decoding_order(ax, ann.decoding_order, kps)
+
+    def _check_decoding_order(self, ann):
+        """Warn when the decoding order is shown but was not recorded by the decoder."""
+        if not (self.show_decoding_order
+                or self.show_frontier_order
+                or self.show_only_decoded_connections):
+            return
+        n_keypoints = np.sum(ann.data[:, 2] > 0.0)
+        if n_keypoints > 1 and not getattr(ann, 'decoding_order', None):
+            LOG.warning('no decoding order recorded for annotation with %d keypoints '
+                        '(is CifCaf.record_decoding_order set?)', n_keypoints)
 
     @staticmethod
-    def _draw_decoding_order(ax, decoding_order):
-        for step_i, (jsi, jti, jsxyv, jtxyv) in enumerate(decoding_order):
+    def _draw_decoding_order(ax, decoding_order, kps):
+        for step_i, (jsi, jti) in enumerate(decoding_order):
+            jsxyv, jtxyv = kps[jsi], kps[jti]
+            if jsxyv[2] == 0.0 or jtxyv[2] == 0.0:
+                continue
             ax.plot([jsxyv[0], jtxyv[0]], [jsxyv[1], jtxyv[1]], '--', color='black')
             ax.text(0.5 * (jsxyv[0] + jtxyv[0]), 0.5 * (jsxyv[1] + jtxyv[1]),
                     '{}: {} -> {}'.format(step_i, jsi, jti), fontsize=8,
@@ -0,0 +1,181 @@
+import concurrent.futures
+import copy
+import pickle
+import numpy as np
+import openpifpaf
+from openpifpaf.plugins.coco import constants
+
+
+def decoder():
+    cif_meta = openpifpaf.headmeta.Cif(
+        'cif', 'cocokp',
+        keypoints=constants.COCO_KEYPOINTS,
+        sigmas=constants.COCO_PERSON_SIGMAS,
+        pose=constants.COCO_UPRIGHT_POSE,
+        draw_skeleton=constants.COCO_PERSON_SKELETON,
+        score_weights=constants.COCO_PERSON_SCORE_WEIGHTS,
+    )
+    caf_meta = openpifpaf.headmeta.Caf(
+        'caf', 'cocokp',
+        keypoints=constants.COCO_KEYPOINTS,
+        sigmas=constants.COCO_PERSON_SIGMAS,
+        pose=constants.COCO_UPRIGHT_POSE,
+        skeleton=constants.COCO_PERSON_SKELETON,
+    )
+    for head_index, meta in enumerate((cif_meta, caf_meta)):
+        meta.head_index = head_index
+        meta.base_stride = 8
+        meta.upsample_stride = 1
+    return openpifpaf.decoder.CifCaf([cif_meta], [caf_meta])
+
+
+def fields():
+    """All joints at (40, 40) and caf connections between them."""
+    cif = np.zeros((17, 5, 11, 11), dtype=np.float32)
+    cif[:, 0] = 1.0
+    cif[:, 1:3] = 5.0
+    cif[:, 3:5] = 1.0
+    caf = np.zeros((19, 9, 11, 11), dtype=np.float32)
+    caf[:, 0] = 0.8
+    caf[:, 1:5] = 5.0
+    caf[:, 5:9] = 1.0
+    return [cif, caf]
+
+
+def initial_annotation(dtype):
+    ann = openpifpaf.Annotation(constants.COCO_KEYPOINTS, constants.COCO_PERSON_SKELETON)
+    data = np.zeros((17, 3), dtype=dtype)
+    data[0] = (40.0, 40.0, 1.0)
+    return ann.set(data, np.full((17,), 2.0, dtype=dtype))
+
+
+def test_initial_annotation_float64():
+    anns_f32 = decoder()(fields(), initial_annotations=[initial_annotation(np.float32)])
+    anns_f64 = decoder()(fields(), initial_annotations=[initial_annotation(np.float64)])
+
+    assert len(anns_f64) == len(anns_f32) == 1
+    assert np.count_nonzero(anns_f64[0].data[:, 2]) > 1
+    np.testing.assert_allclose(anns_f64[0].data, anns_f32[0].data, rtol=1e-6)
+
+
+def test_pickle_after_decode():
+    decode = decoder()
+    decode.nms = openpifpaf.decoder.utils.nms.Keypoints()
+    decode(fields())
+    decode = pickle.loads(pickle.dumps(decode))
+    assert len(decode(fields())) == 1
+
+
+def test_caf_scored_parts():
+    caf_meta = decoder().caf_metas[0]
+    rng = np.random.default_rng(0)
+    cifhr = rng.uniform(0.0, 1.0, (17, 81, 81)).astype(np.float32)
+    caf = rng.uniform(0.0, 10.0, (19, 9, 11, 11)).astype(np.float32)
+    caf[:, 0] = rng.uniform(0.0, 1.0, (19, 11, 11))
+
+    caf_scored = openpifpaf.decoder.utils.CafScored(cifhr.copy()).fill_single([None, caf], caf_meta)
+    caf_scored_parts = openpifpaf.decoder.utils.CafScored(cifhr.copy()).fill_single(
+        [None, [caf[:5], caf[5:6], caf[6:]]], caf_meta)
+
+    assert sum(f.shape[1] for f in caf_scored.forward) > 0
+    for directed, directed_parts in ((caf_scored.forward, caf_scored_parts.forward),
+                                     (caf_scored.backward, caf_scored_parts.backward)):
+        assert len(directed_parts) == len(directed) == 19
+        for nine, nine_parts in zip(directed, directed_parts):
+            np.testing.assert_array_equal(nine_parts, nine)
+
+
+def test_cif_seeds_get():
+    cif_meta = decoder().cif_metas[0]
+    rng = np.random.default_rng(0)
+    cifhr = rng.uniform(0.0, 1.0, (17, 81, 81)).astype(np.float32)
+    cif = rng.uniform(0.0, 10.0, (17, 5, 11, 11)).astype(np.float32)
+    cif[:, 0] = rng.uniform(0.0, 1.0, (17, 11, 11))
+
+    seeds = openpifpaf.decoder.utils.CifSeeds(cifhr).fill([cif], [cif_meta])
+    seeds_f, seeds_vxys = seeds.get_arrays()
+    seeds_tuples = seeds.get()
+
+    assert len(seeds_tuples) == len(seeds_f) > 0
+    assert seeds_tuples == sorted(seeds_tuples, reverse=True)
+    for (v, f, x, y, s), ff, vxys in zip(seeds_tuples, seeds_f, seeds_vxys):
+        assert f == ff
+        assert (v, x, y, s) == tuple(vxys)
+
+
+def random_fields(seed, height, width):
+    """Three random poses with every field cell pointing to the joint of one of them."""
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(4.0, (width - 4.0, height - 4.0), (3, 1, 2))
+    kps = centers + rng.normal(0.0, 2.0, (3, 17, 2))
+
+    cif = np.empty((17, 5, height, width), dtype=np.float32)
+    cif[:, 0] = rng.uniform(0.3, 1.0, (17, height, width))
+    for f in range(17):
+        person_i = rng.integers(3, size=(height, width))
+        cif[f, 1:3] = np.moveaxis(kps[person_i, f], -1, 0)
+    cif[:, 1:3] += rng.normal(0.0, 0.1, (17, 2, height, width))
+    cif[:, 3:5] = rng.uniform(0.5, 2.0, (17, 2, height, width))
+
+    caf = np.empty((19, 9, height, width), dtype=np.float32)
+    caf[:, 0] = rng.uniform(0.0, 1.0, (19, height, width))
+    for caf_i, (j1, j2) in enumerate(constants.COCO_PERSON_SKELETON):
+        person_i = rng.integers(3, size=(height, width))
+        caf[caf_i, 1:3] = np.moveaxis(kps[person_i, j1 - 1], -1, 0)
+        caf[caf_i, 3:5] = np.moveaxis(kps[person_i, j2 - 1], -1, 0)
+    caf[:, 1:5] += rng.normal(0.0, 0.2, (19, 4, height, width))
+    caf[:, 5:9] = rng.uniform(0.5, 2.0, (19, 4, height, width))
+    return [cif, caf]
+
+
+def assert_annotations_equal(anns, anns_ref):
+    assert len(anns) == len(anns_ref)
+    for ann, ann_ref in zip(anns, anns_ref):
+        np.testing.assert_array_equal(ann.data, ann_ref.data)
+        np.testing.assert_array_equal(ann.joint_scales, ann_ref.joint_scales)
+
+
+def test_decode_changing_shapes():
+    frame_a = random_fields(0, 21, 31)
+    frame_b = random_fields(1, 31, 21)
+    decode = decoder()
+    anns_a = decode(frame_a)
+    anns_b = decode(frame_b)
+    anns_a_again = decode(frame_a)
+
+    assert anns_a
+    assert_annotations_equal(anns_a, decoder()(frame_a))
+    assert_annotations_equal(anns_b, decoder()(frame_b))
+    assert_annotations_equal(anns_a_again, decoder()(frame_a))
+
+
+def test_decode_threads():
+    frames = [random_fields(seed, 21 + seed % 3, 31) for seed in range(8)]
+    anns_ref = [decoder()(frame) for frame in frames]
+
+    decode = decoder()
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        for _ in range(3):
+            for anns, anns_serial in zip(executor.map(decode, frames), anns_ref):
+                assert_annotations_equal(anns, anns_serial)
+
+
+def test_complete_annotations_threads():
+    frame = random_fields(0, 21, 31)
+    decode = decoder()
+    cifhr = openpifpaf.decoder.utils.CifHr().fill(frame, decode.cif_metas)
+    rng = np.random.default_rng(0)
+    anns = []
+    for ann in decode(frame):
+        for _ in range(3):
+            partial = copy.deepcopy(ann)
+            partial.data[rng.permutation(17)[:12], 2] = 0.0
+            anns.append(partial)
+
+    anns_serial = decode.complete_annotations(cifhr, frame, copy.deepcopy(anns))
+    decode.complete_threads = 4
+    anns_threads = decode.complete_annotations(cifhr, frame, copy.deepcopy(anns))
+
+    assert len(anns) >= 4
+    assert all(np.all(ann.data[:, 2] > 0.0) for ann in anns_serial)
+    assert_annotations_equal(anns_threads, anns_serial)
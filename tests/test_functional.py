@@ -0,0 +1,251 @@
+import heapq
+
+import numpy as np
+import pytest
+import openpifpaf
+
+
+@pytest.mark.parametrize('data_dtype', [np.float32, np.float64])
+@pytest.mark.parametrize('scales_dtype', [np.float32, np.float64])
+def test_occupancy_set_keypoints(data_dtype, scales_dtype):
+    data = np.array([[10.0, 12.0, 0.9], [0.0, 0.0, 0.0], [30.0, 5.0, 0.5]], dtype=data_dtype)
+    scales = np.array([4.0, 4.0, 8.0], dtype=scales_dtype)
+
+    occupancy = openpifpaf.functional.Occupancy((3, 40, 40), 2, min_scale=4)
+    occupancy.set_keypoints(data, scales)
+
+    reference = openpifpaf.functional.Occupancy((3, 40, 40), 2, min_scale=4)
+    for f, ((x, y, v), s) in enumerate(zip(data, scales)):
+        if v == 0.0:
+            continue
+        reference.set(f, x, y, s)
+
+    assert np.any(occupancy.occupancy)
+    np.testing.assert_array_equal(occupancy.occupancy, reference.occupancy)
+
+
+@pytest.mark.parametrize('data_dtype', [np.float32, np.float64])
+@pytest.mark.parametrize('scales_dtype', [np.float32, np.float64])
+def test_occupancy_suppress_keypoints(data_dtype, scales_dtype):
+    data = np.array([[10.0, 12.0, 0.9], [0.0, 0.0, 0.0], [30.0, 5.0, 0.5]], dtype=data_dtype)
+    scales = np.array([4.0, 4.0, 8.0], dtype=scales_dtype)
+
+    occupancy = openpifpaf.functional.Occupancy((3, 40, 40), 2, min_scale=4)
+    occupancy.set(2, 30.0, 5.0, 4.0)
+    occupancy.suppress_keypoints(data, scales, 0.5)
+
+    np.testing.assert_allclose(data[:, 2], [0.9, 0.0, 0.25])
+    assert occupancy.get(0, 10.0, 12.0)
+
+
+def heapq_pop_all(entries):
+    """Reference order of the (-score, xysv, start_i, end_i) min-heap used before Frontier."""
+    heap = []
+    for score, xysv, start_i, end_i in entries:
+        heapq.heappush(heap, (-score, xysv, start_i, end_i))
+    return [(-neg_score, xysv, start_i, end_i)
+            for neg_score, xysv, start_i, end_i in (heapq.heappop(heap) for _ in range(len(heap)))]
+
+
+def frontier_pop_all(frontier):
+    popped = []
+    while True:
+        entry = frontier.pop()
+        if entry is None:
+            return popped
+        popped.append(entry)
+
+
+def test_frontier_candidates_order():
+    rng = np.random.default_rng(0)
+    connections = [(s, e) for s in range(17) for e in range(17) if s != e]
+    entries = [(float(rng.choice([0.1, 0.5, 0.9])), None, s, e)
+               for i, (s, e) in enumerate(connections) if i % 3 == 0]
+    rng.shuffle(entries)
+
+    frontier = openpifpaf.functional.Frontier(17)
+    for score, _, start_i, end_i in entries:
+        assert frontier.add(score, start_i, end_i)
+    assert len(frontier) == len(entries)
+
+    assert frontier_pop_all(frontier) == heapq_pop_all(entries)
+    assert len(frontier) == 0
+
+
+def test_frontier_evaluated_order():
+    rng = np.random.default_rng(1)
+    entries = []
+    for _ in range(200):
+        xysv = tuple(float(c) for c in rng.choice([1.0, 2.0], size=4))
+        entries.append((float(rng.choice([0.25, 0.75])), xysv,
+                        int(rng.integers(17)), int(rng.integers(17))))
+
+    frontier = openpifpaf.functional.Frontier(17)
+    for score, xysv, start_i, end_i in entries:
+        frontier.push(score, start_i, end_i, *xysv)
+
+    assert frontier_pop_all(frontier) == heapq_pop_all(entries)
+
+
+def test_frontier_interleaved():
+    """Mixed add, push and pop with scores that never tie between candidates and evaluated."""
+    rng = np.random.default_rng(2)
+    frontier = openpifpaf.functional.Frontier(17)
+    heap = []
+    in_frontier = set()
+    for _ in range(500):
+        op = rng.integers(3)
+        if op == 0:
+            start_i, end_i = int(rng.integers(17)), int(rng.integers(17))
+            score = float(rng.choice([0.1, 0.3, 0.5]))
+            assert frontier.add(score, start_i, end_i) != ((start_i, end_i) in in_frontier)
+            if (start_i, end_i) not in in_frontier:
+                heapq.heappush(heap, (-score, None, start_i, end_i))
+                in_frontier.add((start_i, end_i))
+        elif op == 1:
+            start_i, end_i = int(rng.integers(17)), int(rng.integers(17))
+            score = float(rng.choice([0.2, 0.4]))
+            xysv = tuple(float(c) for c in rng.choice([1.0, 2.0], size=4))
+            frontier.push(score, start_i, end_i, *xysv)
+            heapq.heappush(heap, (-score, xysv, start_i, end_i))
+        elif heap:
+            neg_score, xysv, start_i, end_i = heapq.heappop(heap)
+            assert frontier.pop() == (-neg_score, xysv, start_i, end_i)
+        else:
+            assert frontier.pop() is None
+        assert len(frontier) == len(heap)
+
+
+def test_frontier_evaluated_before_candidate():
+    # heapq could not compare None with a tuple for equal scores
+    frontier = openpifpaf.functional.Frontier(17)
+    frontier.add(0.5, 0, 1)
+    frontier.push(0.5, 2, 3, 1.0, 2.0, 3.0, 0.5)
+    assert frontier.pop() == (0.5, (1.0, 2.0, 3.0, 0.5), 2, 3)
+    assert frontier.pop() == (0.5, None, 0, 1)
+
+
+@pytest.mark.parametrize('frontier_cls', ['Frontier', 'BucketedFrontier'])
+@pytest.mark.parametrize('start_i,end_i', [(-1, 0), (0, -1), (17, 0), (0, 17)])
+def test_frontier_add_out_of_range(frontier_cls, start_i, end_i):
+    frontier = getattr(openpifpaf.functional, frontier_cls)(17)
+    with pytest.raises(IndexError):
+        frontier.add(0.5, start_i, end_i)
+    assert len(frontier) == 0
+
+
+def bucket(score, n_buckets):
+    if score <= 0.0:
+        return 0
+    return int(min(score, 1.0) * (n_buckets - 1))
+
+
+def test_bucketed_frontier_order():
+    n_buckets = 16
+    rng = np.random.default_rng(3)
+    scores = rng.uniform(-0.1, 1.1, size=200)
+
+    frontier = openpifpaf.functional.BucketedFrontier(17, n_buckets)
+    for i, score in enumerate(scores):
+        frontier.push(score, 0, 1, float(i), 0.0, 0.0, 0.0)
+    assert len(frontier) == len(scores)
+
+    popped = [int(xysv[0]) for _, xysv, _, _ in frontier_pop_all(frontier)]
+    assert sorted(popped) == list(range(len(scores)))
+    # highest bucket first and the last added entry first within a bucket
+    assert popped == sorted(range(len(scores)), key=lambda i: (-bucket(scores[i], n_buckets), -i))
+    assert len(frontier) == 0
+
+
+def test_bucketed_frontier_interleaved():
+    """Every entry is popped once, also when slots are reused and the capacity grows."""
+    n_buckets = 8
+    rng = np.random.default_rng(4)
+    frontier = openpifpaf.functional.BucketedFrontier(17, n_buckets)
+    pending = {}
+    for i in range(1000):
+        if pending and rng.uniform() < 0.4:
+            score, xysv, _, _ = frontier.pop()
+            popped_i = int(xysv[0])
+            assert pending.pop(popped_i) == score
+            # no pending entry is in a higher bucket
+            assert all(bucket(s, n_buckets) <= bucket(score, n_buckets) for s in pending.values())
+        else:
+            score = float(rng.uniform())
+            frontier.push(score, 0, 1, float(i), 0.0, 0.0, 0.0)
+            pending[i] = score
+        assert len(frontier) == len(pending)
+
+    for score, xysv, _, _ in frontier_pop_all(frontier):
+        assert pending.pop(int(xysv[0])) == score
+    assert not pending
+    assert frontier.pop() is None
+
+
+def test_bucketed_frontier_add_once():
+    frontier = openpifpaf.functional.BucketedFrontier(17)
+    assert frontier.add(0.5, 0, 1)
+    assert not frontier.add(0.9, 0, 1)
+    assert frontier.add(0.9, 1, 0)
+    assert frontier_pop_all(frontier) == [(0.9, None, 1, 0), (0.5, None, 0, 1)]
+
+
+def connection_value_python(caf_f, caf_b, xyv, xy_scale_s, *, only_max,
+                            keypoint_threshold, keypoint_threshold_rel, reverse_match):
+    """Previous implementation of CifCaf.connection_value() in Python."""
+    grow_connection_blend = openpifpaf.functional.grow_connection_blend
+    xy_scale_s = max(0.0, xy_scale_s)
+
+    new_xysv = grow_connection_blend(caf_f, xyv[0], xyv[1], xy_scale_s, only_max)
+    if new_xysv[3] == 0.0:
+        return 0.0, 0.0, 0.0, 0.0
+    keypoint_score = np.sqrt(new_xysv[3] * xyv[2])  # geometric mean
+    if keypoint_score < keypoint_threshold:
+        return 0.0, 0.0, 0.0, 0.0
+    if keypoint_score < xyv[2] * keypoint_threshold_rel:
+        return 0.0, 0.0, 0.0, 0.0
+    xy_scale_t = max(0.0, new_xysv[2])
+
+    # reverse match
+    if reverse_match:
+        reverse_xyv = grow_connection_blend(
+            caf_b, new_xysv[0], new_xysv[1], xy_scale_t, only_max)
+        if reverse_xyv[2] == 0.0:
+            return 0.0, 0.0, 0.0, 0.0
+        if abs(xyv[0] - reverse_xyv[0]) + abs(xyv[1] - reverse_xyv[1]) > xy_scale_s:
+            return 0.0, 0.0, 0.0, 0.0
+
+    return (new_xysv[0], new_xysv[1], new_xysv[2], keypoint_score)
+
+
+@pytest.mark.parametrize('only_max', [False, True])
+@pytest.mark.parametrize('reverse_match', [False, True])
+def test_connection_value(only_max, reverse_match):
+    rng = np.random.default_rng(5)
+    n = 50
+    caf_f = np.empty((9, n), dtype=np.float32)
+    caf_f[0] = rng.uniform(0.2, 1.0, n)
+    caf_f[1:3] = rng.normal(10.0, 2.0, (2, n))
+    caf_f[3:5] = rng.normal(20.0, 2.0, (2, n))
+    caf_f[5:9] = rng.uniform(1.0, 4.0, (4, n))
+    caf_b = np.ascontiguousarray(caf_f[(0, 3, 4, 1, 2, 6, 5, 8, 7), :])
+
+    data = np.zeros((100, 3), dtype=np.float32)
+    data[:, :2] = rng.normal(10.0, 3.0, (100, 2))
+    data[:, 2] = rng.uniform(0.1, 1.0, 100)
+    joint_scales = rng.uniform(0.5, 5.0, 100).astype(np.float32)
+
+    n_accepted = 0
+    for start_i, xyv in enumerate(data):
+        value = openpifpaf.functional.connection_value(
+            caf_f, caf_b, data, joint_scales, start_i,
+            only_max=only_max, keypoint_threshold=0.15, keypoint_threshold_rel=0.5,
+            reverse_match=reverse_match)
+        expected = connection_value_python(
+            caf_f, caf_b, xyv, joint_scales[start_i],
+            only_max=only_max, keypoint_threshold=0.15, keypoint_threshold_rel=0.5,
+            reverse_match=reverse_match)
+        np.testing.assert_allclose(value, expected, rtol=1e-6)
+        n_accepted += value[3] > 0.0
+
+    assert 0 < n_accepted < len(data)